@@ -1,17 +1,38 @@
 import os
 import sys
 import json
+import gc
+import re
+import time
+import itertools
+import html
+import hashlib
+import tempfile
+import tracemalloc
+import logging
+from logging.handlers import RotatingFileHandler
+from collections import Counter
+from html.parser import HTMLParser
+from urllib.parse import urlsplit, urlunsplit
 from PySide6.QtCore import *
 from PySide6.QtWidgets import *
 from PySide6.QtWebEngineWidgets import *
 from PySide6.QtGui import *
-from PySide6.QtWebEngineCore import QWebEngineDownloadRequest
+from PySide6.QtWebEngineCore import QWebEngineDownloadRequest, QWebEnginePage, QWebEngineProfile, QWebEngineScript
 from pathlib import Path
+from dataclasses import dataclass, field, fields, asdict
 
 
 CONFIG_FILE = Path(os.getenv("XDG_CONFIG_HOME", "~/.config")).expanduser()/"gamma-browser"/"config.json"
 HISTORY_FILE = Path(os.getenv("XDG_CONFIG_HOME", "~/.config")).expanduser()/"gamma-browser"/"history.json"
 BOOKMARKS_FILE = Path(os.getenv("XDG_CONFIG_HOME", "~/.config")).expanduser()/"gamma-browser"/"bookmarks.json"
+READER_CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME", "~/.cache")).expanduser()/"gamma-browser"/"reader"
+# Cached articles younger than this are shown without extracting the page again
+READER_CACHE_TTL = 24 * 60 * 60
+DIAGNOSTICS_LOG = Path(os.getenv("XDG_CACHE_HOME", "~/.cache")).expanduser()/"gamma-browser"/"diagnostics.log"
+
+DIAGNOSTICS_INTERVAL_MS = 30 * 1000
+DIAGNOSTICS_TOP_COUNT = 10
 
 
 # Define search engines and their base URLs
@@ -24,48 +45,413 @@ SEARCH_ENGINES = {
     "Gibiru": "https://gibiru.com"\
 }
 
-def load_config():
-    default_config = {
-        "home_url": "https://www.duckduckgo.com",
-        "default_search_engine": "DuckDuckGo",
-        "dark_mode": False,
-        "show_toolbar": True,
+# Stylesheet injected into web pages when web dark mode is enabled
+DARK_MODE_SCRIPT_NAME = "gamma-dark-mode"
+# The page is forced into light colours and then inverted. Combining the invert filter
+# with a dark color-scheme would turn unstyled text dark on a dark background
+DARK_MODE_STYLESHEET = """
+:root { color-scheme: light !important; }
+html { background: #fff; color: #000; filter: invert(1) hue-rotate(180deg); }
+img, video, picture, canvas, iframe, embed, object, svg image, [style*="background-image"] {
+    filter: invert(1) hue-rotate(180deg);
+}
+"""
+
+# The script is rebuilt only when the dark mode settings change, with the
+# excepted hosts embedded as a Set so each page load is a few lookups
+DARK_MODE_SCRIPT = """
+(function () {
+    var exceptions = new Set(%(exceptions)s);
+    var old = document.getElementById("%(name)s");
+    if (old) {
+        old.remove();
+    }
+
+    // Exceptions also cover subdomains, e.g. "example.com" matches "www.example.com"
+    var labels = location.hostname.split(".");
+    for (var i = 0; i < labels.length; i++) {
+        if (exceptions.has(labels.slice(i).join("."))) {
+            return;
+        }
     }
 
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as file:
-            try:
-                config = json.load(file)
-            except json.JSONDecodeError:
-                config = {}
-    else:
-        config = {}
-
-    # Update config with any missing keys from default_config
-    for key, value in default_config.items():
-        config.setdefault(key, value)
-
-    # Save updated config if any defaults were added
-    save_config(config)
+    var style = document.createElement("style");
+    style.id = "%(name)s";
+    style.textContent = %(stylesheet)s;
+
+    function inject() {
+        if (!document.documentElement) {
+            return false;
+        }
+        document.documentElement.appendChild(style);
+        return true;
+    }
+
+    if (!inject()) {
+        new MutationObserver(function (mutations, observer) {
+            if (inject()) {
+                observer.disconnect();
+            }
+        }).observe(document, { childList: true });
+    }
+})();
+"""
+
+DARK_MODE_REMOVE_SCRIPT = """
+(function () {
+    var style = document.getElementById("%(name)s");
+    if (style) {
+        style.remove();
+    }
+})();
+""" % {"name": DARK_MODE_SCRIPT_NAME}
+
+def build_dark_mode_script(exceptions):
+    return DARK_MODE_SCRIPT % {
+        "name": DARK_MODE_SCRIPT_NAME,
+        "exceptions": json.dumps(sorted(set(exceptions))),
+        "stylesheet": json.dumps(DARK_MODE_STYLESHEET),
+    }
+
+# Bump CONFIG_VERSION and register a migration when the config layout changes
+CONFIG_VERSION = 1
+
+
+@dataclass(slots=True)
+class Config:
+    home_url: str = "https://www.duckduckgo.com"
+    default_search_engine: str = "DuckDuckGo"
+    dark_mode: bool = False
+    show_toolbar: bool = True
+    web_dark_mode: bool = False
+    dark_mode_exceptions: list = field(default_factory=list)
+    # 0 keeps history forever
+    history_retention_days: int = 0
+    diagnostics: bool = False
+
+    @classmethod
+    def from_dict(cls, data):
+        config = cls()
+        for config_field in fields(cls):
+            value = data.get(config_field.name)
+            # Keep the default for missing keys and values of the wrong type
+            if type(value) is type(getattr(config, config_field.name)):
+                setattr(config, config_field.name, value)
+
+        if config.default_search_engine not in SEARCH_ENGINES:
+            config.default_search_engine = cls().default_search_engine
+        config.history_retention_days = max(config.history_retention_days, 0)
+        config.dark_mode_exceptions = sorted(
+            {host.strip().lower() for host in config.dark_mode_exceptions if isinstance(host, str) and host.strip()}
+        )
+        return config
+
+    def to_dict(self):
+        data = {"version": CONFIG_VERSION}
+        data.update(asdict(self))
+        return data
+
+
+def migrate_config_v0(config):
+    # Unversioned configs already use the version 1 keys
     return config
 
+# Maps a config version to the function upgrading it to the next version
+CONFIG_MIGRATIONS = {
+    0: migrate_config_v0,
+}
+
+def config_version(config):
+    version = config.get("version") if isinstance(config, dict) else None
+    # Missing, non-integer and negative versions are treated as unversioned
+    if type(version) is not int or version < 0:
+        return 0
+    return version
+
+def migrate_config(config):
+    config = dict(config)
+    version = config_version(config)
+    while version < CONFIG_VERSION:
+        config = CONFIG_MIGRATIONS[version](config)
+        version += 1
+    config["version"] = version
+    return config
+
+def parse_config(data):
+    if not isinstance(data, dict):
+        return None
+    return Config.from_dict(migrate_config(data))
+
+def load_config():
+    data = load_json_file(CONFIG_FILE, None)
+    config = parse_config(data) or Config()
+
+    # Only write the file back if it is missing, outdated or invalid, and never
+    # downgrade a file written by a newer version of the browser
+    version = config_version(data)
+    if version <= CONFIG_VERSION and config.to_dict() != data:
+        save_config(config)
+        version = CONFIG_VERSION
+    return config, version
+
 def save_config(config):
-    with open(CONFIG_FILE, "w") as file:
-        json.dump(config, file, indent=4)
+    CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so the file watcher never sees a partial file
+    temp_file = CONFIG_FILE.with_suffix(".tmp")
+    with open(temp_file, "w") as file:
+        json.dump(config.to_dict(), file, indent=4)
+    os.replace(temp_file, CONFIG_FILE)
 
 def load_json_file(filename, default):
     if os.path.exists(filename):
-        with open(filename, "r") as file:
-            try:
+        try:
+            with open(filename, "r") as file:
                 return json.load(file)
-            except json.JSONDecodeError:
-                return default
+        except (OSError, ValueError):
+            return default
     return default
 
 def save_json_file(filename, data):
     with open(filename, "w") as file:
         json.dump(data, file, indent=4)
 
+class ConfigManager(QObject):
+    # One signal per config key, so only the affected parts of the UI update
+    home_url_changed = Signal(str)
+    default_search_engine_changed = Signal(str)
+    dark_mode_changed = Signal(bool)
+    show_toolbar_changed = Signal(bool)
+    web_dark_mode_changed = Signal(bool)
+    dark_mode_exceptions_changed = Signal(list)
+    history_retention_days_changed = Signal(int)
+    diagnostics_changed = Signal(bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # Version of the file on disk, a newer one is never overwritten
+        self.config, self.file_version = load_config()
+
+        # Reload the config when it is edited outside the browser
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.reload)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+        self.watch_file()
+
+    def watch_file(self):
+        # Replacing the file drops it from the watcher, so add it again. The directory
+        # is watched too, to notice the file coming back after an editor deleted it
+        directory = str(CONFIG_FILE.parent)
+        if os.path.isdir(directory) and directory not in self.watcher.directories():
+            self.watcher.addPath(directory)
+        path = str(CONFIG_FILE)
+        if os.path.exists(path) and path not in self.watcher.files():
+            self.watcher.addPath(path)
+
+    def directory_changed(self):
+        if str(CONFIG_FILE) not in self.watcher.files() and os.path.exists(CONFIG_FILE):
+            self.reload()
+
+    def update(self, **values):
+        # Changes to a config from a newer version only last for this session
+        if self.apply(values) and self.file_version <= CONFIG_VERSION:
+            save_config(self.config)
+            self.file_version = CONFIG_VERSION
+            self.watch_file()
+
+    def apply(self, values):
+        changed = [key for key, value in values.items() if getattr(self.config, key) != value]
+        for key in changed:
+            setattr(self.config, key, values[key])
+        for key in changed:
+            getattr(self, f"{key}_changed").emit(values[key])
+        return changed
+
+    def reload(self):
+        self.watch_file()
+        # Ignore unreadable files, e.g. while an editor is still writing
+        data = load_json_file(CONFIG_FILE, None)
+        config = parse_config(data)
+        if config is not None:
+            self.file_version = config_version(data)
+            self.apply(asdict(config))
+
+
+# Query parameters that only track where a visit came from
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_hsenc", "_hsmi", "mkt_tok", "ref_src", "ref_url",
+}
+TRACKING_PREFIXES = ("utm_",)
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+HISTORY_SAVE_DELAY_MS = 2000
+HISTORY_COMPACT_INTERVAL_MS = 60 * 60 * 1000
+
+def normalize_url(url):
+    # Only used as the deduplication key, entries keep the URL that was visited
+    parts = urlsplit(url)
+    if parts.scheme not in DEFAULT_PORTS:
+        return url
+
+    # Canonical host: lowercase, without "www." and the default port
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != DEFAULT_PORTS[parts.scheme]:
+        host = f"{host}:{port}"
+
+    # Filter the raw query so the remaining parameters keep their encoding
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not is_tracking_param(param.split("=", 1)[0].lower())
+    )
+    return urlunsplit((parts.scheme, host, parts.path or "/", query, ""))
+
+def is_tracking_param(name):
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+class HistoryWriter(QRunnable):
+    # Serializes and writes a snapshot of the history off the UI thread
+    def __init__(self, path, entries):
+        super().__init__()
+        self.path = path
+        self.entries = entries
+
+    def run(self):
+        directory = os.path.dirname(self.path) or "."
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as file:
+            json.dump(self.entries, file)
+        os.replace(file.name, self.path)
+
+
+class History(QObject):
+    # Visited URLs keyed by their normalized form, ordered from oldest to most recent visit.
+    # Each entry keeps the URL as it was last visited for display and bookmarking
+    def __init__(self, path, retention_days, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.retention_days = retention_days
+        self.entries = {}
+        self.load()
+
+        # A single writer thread keeps the snapshots in order
+        self.writer_pool = QThreadPool(self)
+        self.writer_pool.setMaxThreadCount(1)
+
+        # Batch writes instead of rewriting the file on every URL change
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(HISTORY_SAVE_DELAY_MS)
+        self.save_timer.timeout.connect(self.save)
+
+        self.compact_timer = QTimer(self)
+        self.compact_timer.setInterval(HISTORY_COMPACT_INTERVAL_MS)
+        self.compact_timer.timeout.connect(self.compact)
+        self.compact_timer.start()
+        QTimer.singleShot(0, self.compact)
+
+    def load(self):
+        data = load_json_file(self.path, [])
+        if not isinstance(data, list):
+            return
+
+        # Older versions stored bare URLs without a visit time
+        legacy_time = os.path.getmtime(self.path) if os.path.exists(self.path) else time.time()
+        for item in data:
+            if isinstance(item, str):
+                item = {"url": item, "visited": legacy_time, "visits": 1}
+            if isinstance(item, dict) and isinstance(item.get("url"), str):
+                # Fall back to defaults for fields of the wrong type
+                visited = item.get("visited")
+                visits = item.get("visits")
+                entry = {
+                    "url": item["url"],
+                    "visited": visited if type(visited) in (int, float) else legacy_time,
+                    "visits": visits if type(visits) is int and visits > 0 else 1,
+                }
+
+                # Merge URLs that normalize to the same key, keeping the latest visit
+                key = normalize_url(entry["url"])
+                existing = self.entries.get(key)
+                if existing is None:
+                    self.entries[key] = entry
+                else:
+                    existing["visits"] += entry["visits"]
+                    if entry["visited"] >= existing["visited"]:
+                        existing["url"] = entry["url"]
+                        existing["visited"] = entry["visited"]
+
+        # Keys are normalized here once, compaction relies on the visit order
+        self.entries = dict(sorted(self.entries.items(), key=lambda item: item[1]["visited"]))
+
+    def save(self):
+        self.save_timer.stop()
+        # Copy the entries, record() keeps updating them while the writer runs
+        entries = [dict(entry) for entry in self.entries.values()]
+        self.writer_pool.start(HistoryWriter(str(self.path), entries))
+
+    def flush(self):
+        if self.save_timer.isActive():
+            self.save()
+        self.writer_pool.waitForDone()
+
+    def schedule_save(self):
+        self.save_timer.start()
+
+    def urls(self):
+        return [entry["url"] for entry in self.entries.values()]
+
+    def record(self, url, replaces=None):
+        key = normalize_url(url)
+
+        # Drop the replaced entry unless it was visited before
+        if replaces is not None and replaces != key:
+            previous = self.entries.get(replaces)
+            if previous is not None:
+                if previous["visits"] > 1:
+                    previous["visits"] -= 1
+                else:
+                    del self.entries[replaces]
+
+        entry = self.entries.pop(key, None) or {"url": url, "visited": 0, "visits": 0}
+        if replaces != key:
+            entry["visits"] += 1
+        entry["url"] = url
+        entry["visited"] = time.time()
+        self.entries[key] = entry
+        self.schedule_save()
+        return key
+
+    def set_retention_days(self, retention_days):
+        self.retention_days = retention_days
+        self.compact()
+
+    def compact(self):
+        if not self.retention_days:
+            return
+
+        # Entries are ordered by visit time, so expired ones are all at the front
+        cutoff = time.time() - self.retention_days * 86400
+        expired = 0
+        for entry in self.entries.values():
+            if entry["visited"] >= cutoff:
+                break
+            expired += 1
+        if not expired:
+            return
+
+        for key in list(itertools.islice(self.entries, expired)):
+            del self.entries[key]
+        self.save()
+
+
 class DownloadManagerDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -111,15 +497,530 @@ class DownloadManagerDialog(QDialog):
             item.setText(f"Failed: {download_item.url().fileName()}")
 
 
+# Tags whose content never belongs to an article
+READER_SKIP_TAGS = {
+    "script", "style", "noscript", "template", "iframe", "svg", "canvas", "object",
+    "form", "button", "select", "textarea", "nav", "header", "footer", "aside",
+}
+# Tags kept when rendering the article, everything else is unwrapped
+READER_KEEP_TAGS = {
+    "p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "dl", "dt", "dd",
+    "blockquote", "pre", "code", "a", "img", "figure", "figcaption", "em", "strong",
+    "b", "i", "u", "sub", "sup", "br", "hr", "table", "thead", "tbody", "tr", "th", "td",
+}
+READER_KEEP_ATTRIBUTES = {"a": ("href",), "img": ("src", "alt")}
+READER_URL_ATTRIBUTES = {"href", "src"}
+# Relative URLs have an empty scheme
+READER_URL_SCHEMES = {"", "http", "https", "mailto"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr",
+}
+# Tags that implicitly close an open <p>
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "div", "dl", "figure", "footer", "form", "h1", "h2",
+    "h3", "h4", "h5", "h6", "header", "hr", "main", "nav", "ol", "p", "pre", "section", "table", "ul",
+}
+POSITIVE_CLASS_RE = re.compile(r"article|body|content|entry|main|page|post|text|blog|story", re.I)
+NEGATIVE_CLASS_RE = re.compile(
+    r"comment|meta|footer|foot|sidebar|side|nav|menu|share|social|related|promo|sponsor|"
+    r"ad-|ads|banner|widget|popup|cookie|subscribe|newsletter|combx|masthead",
+    re.I,
+)
+
+READER_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>%(title)s</title>
+<style>
+:root { color-scheme: light dark; }
+body { max-width: 42em; margin: 2em auto; padding: 0 1em; font: 19px/1.6 Georgia, serif; }
+img, video { max-width: 100%%; height: auto; }
+pre { overflow-x: auto; }
+</style>
+</head>
+<body>
+<h1>%(title)s</h1>
+%(content)s
+</body>
+</html>
+"""
+
+
+class ReaderNode:
+    __slots__ = ("tag", "attrs", "parent", "children")
+
+    def __init__(self, tag, attrs, parent):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children = []
+
+    def text(self):
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            else:
+                stack.extend(reversed(node.children))
+        return " ".join("".join(parts).split())
+
+    def link_density(self, text_length):
+        if not text_length:
+            return 1
+        links = [node for node in self.iter() if node.tag == "a"]
+        return sum(len(link.text()) for link in links) / text_length
+
+    def iter(self):
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(child for child in reversed(node.children) if not isinstance(child, str))
+
+
+class ReaderParser(HTMLParser):
+    # Builds a lightweight tree of the page, dropping content that is never part of an article
+    def __init__(self):
+        super().__init__()
+        self.root = ReaderNode("#root", {}, None)
+        self.current = self.root
+        self.skip_depth = 0
+        self.title = ""
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self.skip_depth:
+            if tag not in VOID_TAGS:
+                self.skip_depth += 1
+            return
+        if tag in VOID_TAGS:
+            self.current.children.append(ReaderNode(tag, attrs, self.current))
+            return
+        if tag in READER_SKIP_TAGS or "hidden" in attrs or attrs.get("aria-hidden") == "true":
+            self.skip_depth = 1
+            return
+
+        if tag in BLOCK_TAGS and self.current.tag == "p":
+            self.current = self.current.parent
+        node = ReaderNode(tag, attrs, self.current)
+        self.current.children.append(node)
+        self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            self.skip_depth -= 1
+            return
+
+        # Close the matching element, ignoring stray end tags
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        if self.skip_depth:
+            return
+        if self.current.tag == "title":
+            self.title += data
+        elif self.current.tag not in ("head", "#root"):
+            self.current.children.append(data)
+
+
+def class_weight(node):
+    weight = 0
+    for name in (node.attrs.get("class"), node.attrs.get("id")):
+        if not name:
+            continue
+        if NEGATIVE_CLASS_RE.search(name):
+            weight -= 25
+        if POSITIVE_CLASS_RE.search(name):
+            weight += 25
+    if node.tag in ("article", "main"):
+        weight += 10
+    elif node.tag in ("div", "section"):
+        weight += 5
+    return weight
+
+def safe_reader_url(value):
+    # Browsers drop control characters and surrounding spaces, so "java\tscript:" still runs
+    value = re.sub(r"[\x00-\x1f\x7f]", "", value).strip()
+    try:
+        scheme = urlsplit(value).scheme.lower()
+    except ValueError:
+        return None
+    return value if scheme in READER_URL_SCHEMES else None
+
+def render_reader_node(node, parts):
+    if isinstance(node, str):
+        parts.append(html.escape(node, quote=False))
+        return
+
+    keep = node.tag in READER_KEEP_TAGS
+    if keep:
+        attrs = ""
+        for name in READER_KEEP_ATTRIBUTES.get(node.tag, ()):
+            value = node.attrs.get(name)
+            if value and name in READER_URL_ATTRIBUTES:
+                value = safe_reader_url(value)
+            if value:
+                attrs += f' {name}="{html.escape(value)}"'
+        parts.append(f"<{node.tag}{attrs}>")
+    for child in node.children:
+        render_reader_node(child, parts)
+    if keep and node.tag not in VOID_TAGS:
+        parts.append(f"</{node.tag}>")
+
+def extract_article(page_html):
+    parser = ReaderParser()
+    parser.feed(page_html)
+    parser.close()
+
+    # Readability-style scoring: paragraphs vote for their parent and grandparent
+    scores = {}
+    for node in parser.root.iter():
+        if node.tag not in ("p", "pre", "td", "blockquote"):
+            continue
+        text = node.text()
+        if len(text) < 25:
+            continue
+
+        score = 1 + text.count(",") + min(len(text) // 100, 3)
+        for ancestor, share in ((node.parent, 1), (node.parent.parent, 0.5)):
+            if ancestor is None or ancestor is parser.root:
+                continue
+            if ancestor not in scores:
+                scores[ancestor] = class_weight(ancestor)
+            scores[ancestor] += score * share
+
+    if not scores:
+        return None
+    for node in scores:
+        scores[node] *= 1 - node.link_density(len(node.text()))
+    best = max(scores, key=scores.get)
+
+    # Siblings often hold the rest of the article, e.g. when it is split into several blocks
+    threshold = max(10, scores[best] * 0.2)
+    siblings = best.parent.children if best.parent else [best]
+    parts = []
+    for sibling in siblings:
+        if isinstance(sibling, str):
+            continue
+        if sibling is not best and scores.get(sibling, 0) < threshold:
+            if sibling.tag != "p":
+                continue
+            text = sibling.text()
+            if len(text) < 80 or sibling.link_density(len(text)) > 0.25:
+                continue
+        render_reader_node(sibling, parts)
+
+    content = "".join(parts)
+    if len(" ".join(re.sub(r"<[^>]+>", " ", content).split())) < 100:
+        return None
+    return {"title": " ".join(parser.title.split()), "content": content}
+
+def render_article(article):
+    return READER_TEMPLATE % {
+        "title": html.escape(article["title"]),
+        "content": article["content"],
+    }
+
+
+class ReaderCache:
+    # Extracted articles on disk, one file per URL. The live DOM differs on every visit
+    # for pages with ads or timestamps, so entries are reused for a TTL measured from
+    # the file's mtime, and the article hash avoids rewriting unchanged entries
+    def __init__(self, directory, ttl=READER_CACHE_TTL, max_entries=500):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def path(self, url):
+        return self.directory / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def get_entry(self, url):
+        entry = load_json_file(self.path(url), None)
+        if not isinstance(entry, dict) or entry.get("url") != url:
+            return None
+        article = entry.get("article")
+        if not isinstance(article, dict) or not all(isinstance(article.get(key), str) for key in ("title", "content")):
+            return None
+        return entry
+
+    def get(self, url, fresh=True):
+        # Without fresh any cached version will do, e.g. when reading offline
+        entry = self.get_entry(url)
+        if entry is None:
+            return None
+        if fresh and time.time() - self.path(url).stat().st_mtime > self.ttl:
+            return None
+        return entry["article"]
+
+    def put(self, url, article):
+        content_hash = hashlib.sha256(article["content"].encode("utf-8", "surrogatepass")).hexdigest()
+        entry = self.get_entry(url)
+        if entry is not None and entry.get("content_hash") == content_hash and entry["article"] == article:
+            # Same article as before, only renew its TTL
+            os.utime(self.path(url))
+            return
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {"url": url, "content_hash": content_hash, "article": article}
+        with tempfile.NamedTemporaryFile("w", dir=self.directory, suffix=".tmp", delete=False) as file:
+            json.dump(entry, file)
+        os.replace(file.name, self.path(url))
+        self.prune()
+
+    def prune(self):
+        entries = sorted(self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime)
+        for path in entries[:-self.max_entries]:
+            path.unlink(missing_ok=True)
+
+
+class ArticleExtractorSignals(QObject):
+    finished = Signal(object, object, object)
+
+
+class ArticleExtractor(QRunnable):
+    # Looks up, extracts and caches an article off the UI thread
+    def __init__(self, cache, browser, url, page_html):
+        super().__init__()
+        self.cache = cache
+        self.browser = browser
+        self.url = url
+        self.page_html = page_html
+        self.signals = ArticleExtractorSignals()
+
+    def run(self):
+        # Always report back, otherwise the Reader button silently does nothing
+        try:
+            article = self.extract()
+        except Exception:
+            article = None
+        self.signals.finished.emit(self.browser, self.url, article)
+
+    def extract(self):
+        article = self.cache.get(self.url)
+        if article is not None:
+            return article
+
+        article = extract_article(self.page_html)
+        if article is not None:
+            self.cache.put(self.url, article)
+            return article
+
+        # The page may have failed to load, fall back to any cached version
+        return self.cache.get(self.url, fresh=False)
+
+
+# Python classes counted in every diagnostics sample, including their subclasses
+# (e.g. QDialog also counts DownloadManagerDialog and DiagnosticsDialog)
+DIAGNOSTICS_CLASSES = (
+    QWebEngineView, QWebEnginePage, QWebEngineDownloadRequest, QListWidgetItem,
+    QDialog, QTimer, ArticleExtractor,
+)
+
+def process_rss(pid):
+    # Resident memory in bytes, read from /proc on Linux
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def format_size(size):
+    if size is None:
+        return "unknown"
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+class Diagnostics(QObject):
+    # Periodically samples memory use and object counts while diagnostics mode is enabled
+    sampled = Signal(dict)
+    stopped = Signal()
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        self.previous = None
+        self.latest = None
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(DIAGNOSTICS_INTERVAL_MS)
+        self.timer.timeout.connect(self.sample)
+
+        # Snapshots are written as JSON lines so they can be diffed offline
+        self.logger = logging.getLogger("gamma-browser.diagnostics")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.handler = None
+
+    def set_enabled(self, enabled):
+        if enabled:
+            self.start()
+        else:
+            self.stop()
+
+    def start(self):
+        if self.timer.isActive():
+            return
+        if self.handler is None:
+            DIAGNOSTICS_LOG.parent.mkdir(parents=True, exist_ok=True)
+            self.handler = RotatingFileHandler(DIAGNOSTICS_LOG, maxBytes=1024 * 1024, backupCount=5)
+            self.logger.addHandler(self.handler)
+        tracemalloc.start()
+        self.timer.start()
+        self.sample()
+
+    def stop(self):
+        self.timer.stop()
+        tracemalloc.stop()
+        self.previous = self.latest = None
+        if self.handler is not None:
+            self.logger.removeHandler(self.handler)
+            self.handler.close()
+            self.handler = None
+        self.stopped.emit()
+
+    def sample(self):
+        window = self.window
+        views = [window.tabs.widget(i) for i in range(window.tabs.count())]
+        renderers = {view.page().renderProcessPid() for view in views} - {0}
+
+        top = []
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            for stat in snapshot.statistics("lineno")[:DIAGNOSTICS_TOP_COUNT]:
+                frame = stat.traceback[0]
+                top.append({"location": f"{frame.filename}:{frame.lineno}", "size": stat.size, "count": stat.count})
+        else:
+            current = peak = None
+
+        objects = Counter()
+        tracked = Counter()
+        for obj in gc.get_objects():
+            objects[type(obj).__name__] += 1
+            if isinstance(obj, DIAGNOSTICS_CLASSES):
+                for cls in DIAGNOSTICS_CLASSES:
+                    if isinstance(obj, cls):
+                        tracked[cls.__name__] += 1
+        sample = {
+            "time": time.time(),
+            "python_memory": current,
+            "python_memory_peak": peak,
+            "browser_rss": process_rss(os.getpid()),
+            "renderer_rss": {str(pid): process_rss(pid) for pid in sorted(renderers)},
+            "counts": {
+                "tabs": window.tabs.count(),
+                "downloads": len(window.download_manager.downloads),
+                "download_list_items": window.download_manager.download_list.count(),
+                "history_entries": len(window.history.entries),
+                "reader_tabs": len(window.reader_urls),
+            },
+            "objects": {cls.__name__: tracked[cls.__name__] for cls in DIAGNOSTICS_CLASSES},
+            "top_objects": dict(objects.most_common(DIAGNOSTICS_TOP_COUNT)),
+            "top_allocations": top,
+        }
+
+        self.previous, self.latest = self.latest, sample
+        self.logger.info(json.dumps(sample))
+        self.sampled.emit(sample)
+        return sample
+
+    def report(self):
+        sample = self.latest
+        if sample is None:
+            return "Diagnostics mode is disabled. Enable it in Settings."
+        previous = self.previous or sample
+
+        lines = [
+            f"Python memory (tracemalloc): {format_size(sample['python_memory'])}, peak {format_size(sample['python_memory_peak'])}",
+            f"Browser process RSS: {format_size(sample['browser_rss'])}",
+        ]
+        for pid, rss in sample["renderer_rss"].items():
+            lines.append(f"Renderer process {pid} RSS: {format_size(rss)}")
+
+        # Show the change since the previous sample to spot what is growing
+        for title, key in (("Browser objects", "counts"), ("Python objects", "objects"), ("Most common Python objects", "top_objects")):
+            lines += ["", f"{title}:"]
+            for name, count in sample[key].items():
+                delta = count - previous[key].get(name, count)
+                lines.append(f"  {name}: {count}" + (f" ({delta:+})" if delta else ""))
+
+        lines += ["", "Top allocation sites:"]
+        for stat in sample["top_allocations"]:
+            lines.append(f"  {stat['location']}: {format_size(stat['size'])} in {stat['count']} blocks")
+
+        lines += ["", f"Snapshots are logged to {DIAGNOSTICS_LOG}"]
+        return "\n".join(lines)
+
+
+class DiagnosticsDialog(QDialog):
+    def __init__(self, diagnostics, parent=None):
+        super().__init__(parent)
+        self.diagnostics = diagnostics
+        self.setWindowTitle("Diagnostics")
+        self.resize(700, 600)
+        self.setLayout(QVBoxLayout())
+
+        self.report = QPlainTextEdit()
+        self.report.setReadOnly(True)
+        self.layout().addWidget(self.report)
+
+        self.refresh_button = QPushButton("Refresh")
+        self.refresh_button.clicked.connect(self.refresh)
+        self.layout().addWidget(self.refresh_button)
+
+        self.close_button = QPushButton("Close")
+        self.close_button.clicked.connect(self.close)
+        self.layout().addWidget(self.close_button)
+
+        self.diagnostics.sampled.connect(self.update_report)
+        self.diagnostics.stopped.connect(self.update_report)
+        self.update_report()
+
+    def refresh(self):
+        if self.diagnostics.timer.isActive():
+            self.diagnostics.sample()
+
+    def update_report(self, sample=None):
+        self.report.setPlainText(self.diagnostics.report())
+
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super(MainWindow, self).__init__()
-        self.config = load_config()
-        self.history = load_json_file(HISTORY_FILE, [])
+        self.settings = ConfigManager(self)
+        self.config = self.settings.config
+        self.dark_palette = None
+        self.history = History(HISTORY_FILE, self.config.history_retention_days, self)
+        self.history_states = {}
+        self.loading_tabs = set()
+        # Tabs whose current load is a reader mode switch and is not a visit
+        self.skip_history = set()
         self.bookmarks = load_json_file(BOOKMARKS_FILE, [])
+        self.reader_cache = ReaderCache(READER_CACHE_DIR)
+        # Maps a tab in reader mode to the article URL and its back/forward history index
+        self.reader_urls = {}
 
         # Apply dark mode if enabled
-        if self.config["dark_mode"]:
+        if self.config.dark_mode:
             self.enable_dark_mode()
 
         # Initialize Tab Widget
@@ -134,7 +1035,7 @@ class MainWindow(QMainWindow):
 
         # Add navigation bar
         self.navbar = QToolBar()
-        self.navbar.setVisible(self.config.get("show_toolbar", True))
+        self.navbar.setVisible(self.config.show_toolbar)
         self.addToolBar(self.navbar)
 
         # Back button with icon
@@ -167,6 +1068,11 @@ class MainWindow(QMainWindow):
         self.url_bar.returnPressed.connect(self.navigate_to_url)
         self.navbar.addWidget(self.url_bar)
 
+        # Reader mode button
+        reader_btn = QAction("Reader", self)
+        reader_btn.triggered.connect(self.toggle_reader_mode)
+        self.navbar.addAction(reader_btn)
+
         # History button
         history_btn = QAction("History", self)
         history_btn.triggered.connect(self.show_history)
@@ -187,38 +1093,105 @@ class MainWindow(QMainWindow):
         settings_btn.triggered.connect(self.open_settings)
         self.navbar.addAction(settings_btn)
 
+        # Diagnostics button, only shown in diagnostics mode
+        self.diagnostics_btn = QAction("Diagnostics", self)
+        self.diagnostics_btn.triggered.connect(self.open_diagnostics)
+        self.diagnostics_btn.setVisible(self.config.diagnostics)
+        self.navbar.addAction(self.diagnostics_btn)
+
         # Download Manager Dialog
         self.download_manager = DownloadManagerDialog(self)
 
+        # Diagnostics
+        self.diagnostics = Diagnostics(self)
+        self.diagnostics_dialog = None
+
+        # React to settings changes, whether from the dialog or the config file
+        self.settings.dark_mode_changed.connect(self.apply_dark_mode)
+        self.settings.show_toolbar_changed.connect(self.navbar.setVisible)
+        self.settings.web_dark_mode_changed.connect(lambda enabled: self.update_web_dark_mode())
+        self.settings.dark_mode_exceptions_changed.connect(lambda exceptions: self.update_web_dark_mode())
+        self.settings.history_retention_days_changed.connect(self.history.set_retention_days)
+        self.settings.diagnostics_changed.connect(self.diagnostics_btn.setVisible)
+        self.settings.diagnostics_changed.connect(self.diagnostics.set_enabled)
+        self.update_web_dark_mode()
+
         # Initial Tab
-        self.add_new_tab(QUrl(self.config["home_url"]), "Home")
+        self.add_new_tab(QUrl(self.config.home_url), "Home")
+
+        if self.config.diagnostics:
+            self.diagnostics.start()
 
     def enable_dark_mode(self):
-        app.setStyle("Fusion")
-        dark_palette = QPalette()
-        dark_palette.setColor(QPalette.Window, QColor(53, 53, 53))
-        dark_palette.setColor(QPalette.WindowText, Qt.white)
-        dark_palette.setColor(QPalette.Base, QColor(35, 35, 35))
-        dark_palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
-        dark_palette.setColor(QPalette.ToolTipBase, Qt.white)
-        dark_palette.setColor(QPalette.ToolTipText, Qt.white)
-        dark_palette.setColor(QPalette.Text, Qt.white)
-        dark_palette.setColor(QPalette.Button, QColor(53, 53, 53))
-        dark_palette.setColor(QPalette.ButtonText, Qt.white)
-        dark_palette.setColor(QPalette.Highlight, QColor(142, 45, 197).lighter())
-        dark_palette.setColor(QPalette.HighlightedText, Qt.black)
-        app.setPalette(dark_palette)
+        # Switching styles repolishes every widget, so only do it once
+        if app.style().name().lower() != "fusion":
+            app.setStyle("Fusion")
+        # Build the palette once and reuse it on later toggles
+        if self.dark_palette is None:
+            self.dark_palette = QPalette()
+            self.dark_palette.setColor(QPalette.Window, QColor(53, 53, 53))
+            self.dark_palette.setColor(QPalette.WindowText, Qt.white)
+            self.dark_palette.setColor(QPalette.Base, QColor(35, 35, 35))
+            self.dark_palette.setColor(QPalette.AlternateBase, QColor(53, 53, 53))
+            self.dark_palette.setColor(QPalette.ToolTipBase, Qt.white)
+            self.dark_palette.setColor(QPalette.ToolTipText, Qt.white)
+            self.dark_palette.setColor(QPalette.Text, Qt.white)
+            self.dark_palette.setColor(QPalette.Button, QColor(53, 53, 53))
+            self.dark_palette.setColor(QPalette.ButtonText, Qt.white)
+            self.dark_palette.setColor(QPalette.Highlight, QColor(142, 45, 197).lighter())
+            self.dark_palette.setColor(QPalette.HighlightedText, Qt.black)
+        app.setPalette(self.dark_palette)
+
+    def apply_dark_mode(self, enabled):
+        if enabled:
+            self.enable_dark_mode()
+        else:
+            app.setPalette(QApplication.style().standardPalette())
+
+    def update_web_dark_mode(self):
+        # Register the stylesheet once on the profile instead of injecting it per page
+        scripts = QWebEngineProfile.defaultProfile().scripts()
+        for script in scripts.find(DARK_MODE_SCRIPT_NAME):
+            scripts.remove(script)
+
+        if self.config.web_dark_mode:
+            source = build_dark_mode_script(self.config.dark_mode_exceptions)
+            script = QWebEngineScript()
+            script.setName(DARK_MODE_SCRIPT_NAME)
+            script.setSourceCode(source)
+            script.setInjectionPoint(QWebEngineScript.DocumentCreation)
+            script.setWorldId(QWebEngineScript.ApplicationWorld)
+            script.setRunsOnSubFrames(True)
+            scripts.insert(script)
+        else:
+            source = DARK_MODE_REMOVE_SCRIPT
+
+        # Update the pages that are already open without reloading them
+        for i in range(self.tabs.count()):
+            self.tabs.widget(i).page().runJavaScript(source, QWebEngineScript.ApplicationWorld)
+
+    def toggle_dark_mode_exception(self, browser):
+        host = browser.url().host()
+        if not host:
+            return
+
+        # Stored as sorted unique lowercase hosts, the same form Config.from_dict produces
+        exceptions = set(self.config.dark_mode_exceptions)
+        exceptions ^= {host.lower()}
+        self.settings.update(dark_mode_exceptions=sorted(exceptions))
 
     def add_new_tab(self, url=None, label="New Tab"):
         if url is None or not isinstance(url, QUrl):
-            url = QUrl(self.config["home_url"])
+            url = QUrl(self.config.home_url)
         elif isinstance(url, str):
             url = QUrl(url)
 
         browser = QWebEngineView()
         browser.setUrl(url)
         browser.urlChanged.connect(lambda q, browser=browser: self.update_tab(q, browser))
-        browser.urlChanged.connect(self.record_history)
+        browser.urlChanged.connect(lambda q, browser=browser: self.url_changed(q, browser))
+        browser.loadStarted.connect(lambda browser=browser: self.loading_tabs.add(browser))
+        browser.loadFinished.connect(lambda ok, browser=browser: self.load_finished(ok, browser))
         browser.page().profile().downloadRequested.connect(self.handle_download)
 
         i = self.tabs.addTab(browser, label)
@@ -226,6 +1199,10 @@ class MainWindow(QMainWindow):
 
     def close_current_tab(self, index):
         if self.tabs.count() > 1:
+            self.reader_urls.pop(self.tabs.widget(index), None)
+            self.history_states.pop(self.tabs.widget(index), None)
+            self.loading_tabs.discard(self.tabs.widget(index))
+            self.skip_history.discard(self.tabs.widget(index))
             self.tabs.removeTab(index)
 
     def navigate_back(self):
@@ -238,16 +1215,65 @@ class MainWindow(QMainWindow):
         self.tabs.currentWidget().reload()
 
     def navigate_home(self):
-        home_url = self.config["home_url"]
+        home_url = self.config.home_url
         self.tabs.currentWidget().setUrl(QUrl(home_url))
 
     def navigate_to_url(self):
         url = self.url_bar.text()
         if not url.startswith("http"):
-            search_engine_url = SEARCH_ENGINES[self.config["default_search_engine"]]
+            search_engine_url = SEARCH_ENGINES[self.config.default_search_engine]
             url = f"{search_engine_url}{url}"
         self.tabs.currentWidget().setUrl(QUrl(url))
 
+    def toggle_reader_mode(self):
+        browser = self.tabs.currentWidget()
+        if self.in_reader_mode(browser):
+            url, index = self.reader_urls.pop(browser)
+            self.skip_history.add(browser)
+            # Go back to the page the article was extracted from instead of loading it again
+            history = browser.history()
+            if index is not None and index > 0:
+                history.goToItem(history.itemAt(index - 1))
+            else:
+                browser.setUrl(QUrl(url))
+            return
+
+        url = browser.url().toString()
+        browser.page().toHtml(lambda page_html: self.extract_article(browser, url, page_html))
+
+    def extract_article(self, browser, url, page_html):
+        extractor = ArticleExtractor(self.reader_cache, browser, url, page_html)
+        extractor.signals.finished.connect(self.show_article)
+        QThreadPool.globalInstance().start(extractor)
+
+    def show_article(self, browser, url, article):
+        # The tab may have been closed or navigated away while extracting
+        if self.tabs.indexOf(browser) == -1 or browser.url().toString() != url:
+            return
+        if article is None:
+            QMessageBox.information(self, "Reader Mode", "No article was found on this page.")
+            return
+
+        # The history index is known once the reader page has loaded
+        self.reader_urls[browser] = (url, None)
+        self.skip_history.add(browser)
+        browser.setHtml(render_article(article), QUrl(url))
+
+    def in_reader_mode(self, browser):
+        if browser not in self.reader_urls:
+            return False
+        url, index = self.reader_urls[browser]
+        if index is None:
+            return True
+
+        # The reader page has the article's URL, so going back is only visible in the
+        # history index. Fragment links inside the article keep reader mode
+        current_url = browser.url().adjusted(QUrl.RemoveFragment)
+        if browser.history().currentItemIndex() < index or current_url != QUrl(url).adjusted(QUrl.RemoveFragment):
+            del self.reader_urls[browser]
+            return False
+        return True
+
     def update_tab(self, q, browser):
         i = self.tabs.indexOf(browser)
         if i != -1:
@@ -259,11 +1285,50 @@ class MainWindow(QMainWindow):
         if current_browser:
             self.url_bar.setText(current_browser.url().toString())
 
-    def record_history(self, url):
+    def url_changed(self, url, browser):
+        # Following a link out of the reader view leaves reader mode
+        self.in_reader_mode(browser)
+
+        # Redirects happen while loading, only the final URL is recorded in load_finished
+        if browser not in self.loading_tabs and browser not in self.skip_history:
+            self.record_history(url, browser)
+
+    def load_finished(self, ok, browser):
+        self.loading_tabs.discard(browser)
+        if browser in self.skip_history:
+            self.skip_history.discard(browser)
+            if browser in self.reader_urls and self.reader_urls[browser][1] is None:
+                self.reader_urls[browser] = (self.reader_urls[browser][0], browser.history().currentItemIndex())
+            # Keep tracking the tab's history without counting a visit
+            previous = self.history_states.get(browser)
+            if previous is not None:
+                self.history_states[browser] = (previous[0], self.history_state(browser))
+            return
+
+        if ok:
+            self.record_history(browser.url(), browser)
+
+    def history_state(self, browser):
+        history = browser.history()
+        return (history.currentItemIndex(), history.count(), history.backItem().url().toString())
+
+    def record_history(self, url, browser):
         url_str = url.toString()
-        if url_str not in self.history:
-            self.history.append(url_str)
-            save_json_file(HISTORY_FILE, self.history)
+        if not url_str or url.scheme() == "data":
+            return
+
+        # replaceState and reloads keep the tab's back/forward history as it was,
+        # so the new URL replaces the previous entry instead of adding a visit
+        state = self.history_state(browser)
+        replaces = None
+        previous = self.history_states.get(browser)
+        if previous is not None and previous[1] == state:
+            replaces = previous[0]
+        self.history_states[browser] = (self.history.record(url_str, replaces), state)
+
+    def closeEvent(self, event):
+        self.history.flush()
+        super().closeEvent(event)
 
     def open_settings(self):
         dialog = QDialog(self)
@@ -272,49 +1337,64 @@ class MainWindow(QMainWindow):
         dialog.setLayout(layout)
 
         # Home URL setting
-        home_url_edit = QLineEdit(self.config["home_url"])
+        home_url_edit = QLineEdit(self.config.home_url)
         layout.addRow("Home URL:", home_url_edit)
 
         # Default search engine setting (Dropdown menu)
         search_engine_combo = QComboBox()
         search_engine_combo.addItems(SEARCH_ENGINES.keys())
-        search_engine_combo.setCurrentText(self.config["default_search_engine"])
+        search_engine_combo.setCurrentText(self.config.default_search_engine)
         layout.addRow("Default Search Engine:", search_engine_combo)
 
         # Dark mode toggle
         dark_mode_checkbox = QCheckBox()
-        dark_mode_checkbox.setChecked(self.config["dark_mode"])
+        dark_mode_checkbox.setChecked(self.config.dark_mode)
         layout.addRow("Enable Dark Mode:", dark_mode_checkbox)
 
         # Show/Hide toolbar toggle
         toolbar_checkbox = QCheckBox()
-        toolbar_checkbox.setChecked(self.config.get("show_toolbar", True))
+        toolbar_checkbox.setChecked(self.config.show_toolbar)
         layout.addRow("Show Toolbar:", toolbar_checkbox)
 
+        # Web page dark mode toggle
+        web_dark_mode_checkbox = QCheckBox()
+        web_dark_mode_checkbox.setChecked(self.config.web_dark_mode)
+        layout.addRow("Dark Mode for Web Pages:", web_dark_mode_checkbox)
+
+        # History retention setting
+        history_retention_spinbox = QSpinBox()
+        history_retention_spinbox.setRange(0, 3650)
+        history_retention_spinbox.setSuffix(" days")
+        history_retention_spinbox.setSpecialValueText("Forever")
+        history_retention_spinbox.setValue(self.config.history_retention_days)
+        layout.addRow("Keep History For:", history_retention_spinbox)
+
+        # Diagnostics mode toggle
+        diagnostics_checkbox = QCheckBox()
+        diagnostics_checkbox.setChecked(self.config.diagnostics)
+        layout.addRow("Enable Diagnostics:", diagnostics_checkbox)
+
         # Save button
         save_button = QPushButton("Save settings")
-        save_button.clicked.connect(lambda: self.save_settings(home_url_edit.text(), search_engine_combo.currentText(), dark_mode_checkbox.isChecked(), toolbar_checkbox.isChecked(), dialog))
+        save_button.clicked.connect(lambda: self.save_settings(home_url_edit.text(), search_engine_combo.currentText(), dark_mode_checkbox.isChecked(), toolbar_checkbox.isChecked(), web_dark_mode_checkbox.isChecked(), history_retention_spinbox.value(), diagnostics_checkbox.isChecked(), dialog))
         layout.addRow(save_button)
         dialog.exec()
 
-    def save_settings(self, home_url, search_engine, dark_mode, show_toolbar, dialog):
-        self.config["home_url"] = home_url
-        self.config["default_search_engine"] = search_engine
-        self.config["dark_mode"] = dark_mode
-        self.config["show_toolbar"] = show_toolbar
-
-        if dark_mode:
-            self.enable_dark_mode()
-        else:
-            app.setPalette(QApplication.style().standardPalette())
-
-        self.navbar.setVisible(show_toolbar)
-
-        save_config(self.config)
+    def save_settings(self, home_url, search_engine, dark_mode, show_toolbar, web_dark_mode, history_retention_days, diagnostics, dialog):
+        # Only changed keys are written and emitted to their subscribers
+        self.settings.update(
+            home_url=home_url,
+            default_search_engine=search_engine,
+            dark_mode=dark_mode,
+            show_toolbar=show_toolbar,
+            web_dark_mode=web_dark_mode,
+            history_retention_days=history_retention_days,
+            diagnostics=diagnostics,
+        )
         dialog.accept()
 
     def show_history(self):
-        self.show_list_dialog("History", self.history)
+        self.show_list_dialog("History", self.history.urls())
 
     def show_bookmarks(self):
         self.show_list_dialog("Bookmarks", self.bookmarks)
@@ -349,9 +1429,13 @@ class MainWindow(QMainWindow):
         close_action = menu.addAction("Close Tab")
         duplicate_action = menu.addAction("Duplicate Tab")
         reload_action = menu.addAction("Reload Tab")
+        dark_mode_action = menu.addAction("Toggle Dark Mode for This Site")
 
         action = menu.exec(self.tabs.mapToGlobal(position))
         index = self.tabs.tabBar().tabAt(position)
+        # Clicked on the tab bar outside of any tab
+        if index == -1:
+            return
 
         if action == close_action:
             self.close_current_tab(index)
@@ -360,10 +1444,17 @@ class MainWindow(QMainWindow):
             self.add_new_tab(current_url, "Duplicate Tab")
         elif action == reload_action:
             self.tabs.widget(index).reload()
+        elif action == dark_mode_action:
+            self.toggle_dark_mode_exception(self.tabs.widget(index))
 
     def open_download_manager(self):
         self.download_manager.show()
 
+    def open_diagnostics(self):
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(self.diagnostics, self)
+        self.diagnostics_dialog.show()
+
     def handle_download(self, download_item):
         self.download_manager.add_download(download_item)
         download_item.accept()